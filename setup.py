@@ -29,6 +29,21 @@ tests_require = [
     'mock',
 ]
 
+# Compilation optionnelle avec Cython du module serialize, appelé pour chaque
+# ligne reçue (le paquet reste noarch par défaut). Cython n'est alors requis
+# qu'à la construction : VIGILO_CYTHONIZE=1 python setup.py ...
+ext_modules = []
+if os.environ.get("VIGILO_CYTHONIZE"):
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        sys.exit("VIGILO_CYTHONIZE is set but Cython is not installed: "
+                 "install Cython or unset VIGILO_CYTHONIZE.")
+    ext_modules = cythonize(
+        ["src/vigilo/connector/serialize.py"],
+        compiler_directives={"language_level": 2},
+    )
+
 def install_i18n(i18ndir, destdir):
     data_files = []
     langs = []
@@ -70,6 +85,7 @@ setup(name='vigilo-connector',
             'tests': tests_require,
         },
         package_dir={'': 'src'},
+        ext_modules=ext_modules,
         include_package_data=True,
         data_files=install_i18n("i18n", os.path.join(sys.prefix, 'share', 'locale'))
         )
@@ -4,6 +4,7 @@
 
 import re
 import sys
+from collections import deque
 
 from twisted.internet import reactor, defer, tcp, ssl
 from twisted.protocols import tls
@@ -24,6 +25,9 @@ from vigilo.connector import amqp
 from vigilo.connector.interfaces import InterfaceNotProvided
 from vigilo.connector.interfaces import IBusHandler
 
+# Journalisé à chaque échec d'envoi : traduit une seule fois.
+_MSG_SENDING_FAILED = _('Sending failed: %(reason)s')
+
 
 def split_host_port(hostdef, use_ssl=False):
     """
@@ -188,7 +192,7 @@ class VigiloClient(service.Service):
 
         self.handlers = []
         self.deferred = defer.Deferred()
-        self._packetQueue = [] # List of messages waiting to be sent.
+        self._packetQueue = deque() # List of messages waiting to be sent.
         self.channel = None
 
         self.factory = amqp.AmqpFactory(parent=self, user=self.user,
@@ -359,7 +363,7 @@ class VigiloClient(service.Service):
     def _sendPacketQueue(self):
         """Envoie les messages en attente."""
         while self._packetQueue:
-            e, k, m, p, c, t = self._packetQueue.pop(0)
+            e, k, m, p, c, t = self._packetQueue.popleft()
             yield self.send(e, k, m, p, c, t)
 
 
@@ -389,25 +393,22 @@ class VigiloClient(service.Service):
                                        persistent, content_type, ttl))
             return defer.succeed(None)
 
-        properties = {}
-        if ttl and ttl > 0:
-            properties["expiration"] = str(ttl)
-        msg = Content(message, properties=properties)
-
-        kwargs = {}
+        # Les propriétés sont rassemblées avant de construire le contenu.
         if persistent:
-            msg["delivery-mode"] = amqp.PERSISTENT
-            kwargs['immediate'] = False
+            properties = {"delivery-mode": amqp.PERSISTENT}
         else:
-            msg["delivery-mode"] = amqp.NON_PERSISTENT
+            properties = {"delivery-mode": amqp.NON_PERSISTENT}
+        if ttl and ttl > 0:
+            properties["expiration"] = str(ttl)
         if content_type is not None:
-            msg["content-type"] = content_type
+            properties["content-type"] = content_type
+        msg = Content(message, properties=properties)
         if self.log_traffic:
-            LOGGER.debug("PUBLISH to %s with key %s: %s"
-                         % (exchange, routing_key, msg))
+            LOGGER.debug("PUBLISH to %s with key %s: %s",
+                         exchange, routing_key, msg)
         d = self.channel.basic_publish(
                 exchange=exchange, routing_key=routing_key,
-                content=msg, **kwargs)
+                content=msg, immediate=False)
         d.addErrback(self._sendFailed)
         return d
 
@@ -421,8 +422,9 @@ class VigiloClient(service.Service):
         return self.factory.p.queue(*args, **kwargs)
 
     def _sendFailed(self, fail):
-        errmsg = _('Sending failed: %(reason)s')
-        LOGGER.warning(errmsg % {"reason": amqp.getErrorMessage(fail)})
+        LOGGER.warning(_MSG_SENDING_FAILED % {
+            "reason": amqp.getErrorMessage(fail),
+        })
         return fail
 
     def disconnect(self):
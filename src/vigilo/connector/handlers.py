@@ -12,14 +12,12 @@ import os
 import calendar
 from datetime import datetime
 from collections import deque
-from platform import python_version_tuple
 
 from zope.interface import implements
 
 from twisted.internet import defer
 from twisted.internet.interfaces import IConsumer, IPushProducer
 from twisted.application.service import Service
-from twisted.python.failure import Failure
 
 import txamqp
 
@@ -31,9 +29,14 @@ from vigilo.connector.options import parsePublications
 
 from vigilo.common.gettext import translate
 _ = translate(__name__)
+
 from vigilo.common.logging import get_logger, get_error_message
 LOGGER = get_logger(__name__)
 
+# Messages du chemin de traitement des messages, traduits une fois pour toutes.
+_MSG_NOT_JSON = _("Received message is not JSON-encoded: %r")
+_MSG_REQUEUING = _('Requeuing message (%(reason)s).')
+
 
 
 class BusHandler(object):
@@ -175,6 +178,8 @@ class QueueSubscriber(BusHandler):
         """
         Abonne une file d'attente à un I{exchange} AMQP du bus
         """
+        if not self._bindings:
+            return defer.succeed(None)
         dl = []
         for exchange, routing_key in self._bindings:
             d = self.client.channel.queue_bind(queue=self.queue_name,
@@ -209,22 +214,26 @@ class QueueSubscriber(BusHandler):
         fois pour dépiler un autre message (mode PullProducer).
         """
         d = self._queue.get()
-        def cb(msg):
-            if self.client.log_traffic:
-                # Unused variable:
-                # pylint: disable-msg=W0612
-                qname, msgid, unknown, exch, rkey = msg.fields
-                LOGGER.debug("RECEIVED from %s on %s with key %s: %s"
-                             % (exch, qname, rkey, msg.content.body))
-            return self.consumer.write(msg)
-        def eb(f):
-            f.trap(txamqp.queue.Closed) # déconnexion pendant le get()
-            self._production_interrupted = True
-        d.addCallbacks(cb, eb)
+        d.addCallbacks(self._messageReceived, self._getFailed)
         # On ne retourne pas le deferred ici pour éviter des recursion errors:
         # resumeProducing -> write -> resumeProducing -> ...
         #return d
 
+    def _messageReceived(self, msg):
+        """Transmet au destinataire un message dépilé de la file."""
+        if self.client.log_traffic:
+            # Unused variable:
+            # pylint: disable-msg=W0612
+            qname, msgid, unknown, exch, rkey = msg.fields
+            LOGGER.debug("RECEIVED from %s on %s with key %s: %s",
+                         exch, qname, rkey, msg.content.body)
+        return self.consumer.write(msg)
+
+    def _getFailed(self, fail):
+        """Le dépilement a été interrompu par une déconnexion."""
+        fail.trap(txamqp.queue.Closed) # déconnexion pendant le get()
+        self._production_interrupted = True
+
     def _resumeProducingBatchMessage(self):
         """
         Dépile une série de messages de la file d'attente. Appeler une
@@ -249,8 +258,8 @@ class QueueSubscriber(BusHandler):
                 # pylint: disable-msg=W0612
                 for msg in msgs:
                     qname, msgid, unknown, exch, rkey = msg.fields
-                    LOGGER.debug("RECEIVED from %s on %s with key %s: %s"
-                                 % (exch, qname, rkey, msg.content.body))
+                    LOGGER.debug("RECEIVED from %s on %s with key %s: %s",
+                                 exch, qname, rkey, msg.content.body)
             return self.consumer.write_batch(msgs)
         dl.addCallback(cb)
         # On ne retourne pas le deferred ici pour éviter des recursion errors:
@@ -351,19 +360,19 @@ class MessageHandler(BusHandler):
         try:
             content = json.loads(msg.content.body)
         except ValueError:
-            LOGGER.warning(_("Received message is not JSON-encoded: %r"),
-                           msg.content.body)
+            LOGGER.warning(_MSG_NOT_JSON, msg.content.body)
             d = defer.succeed(None)
         else:
-            if content.get("messages"):
-                d = self._processList(content["messages"])
+            batch = content.get("messages")
+            if batch:
+                d = self._processList(batch)
             else:
                 d = defer.maybeDeferred(self.processMessage, content)
             d.addCallbacks(self.processingSucceeded, self.processingFailed,
                            callbackArgs=(msg, ), errbackArgs=(msg, ))
 
         if self.keepProducing:
-            d.addBoth(lambda _x: self.producer.resumeProducing())
+            d.addBoth(self._produceNext)
         return d
 
     def write_batch(self, msgs):
@@ -382,17 +391,20 @@ class MessageHandler(BusHandler):
 
         contents = []
         for msg in msgs:
-            if msg is not None:
-                try:
-                    content = json.loads(msg.content.body)
-                except ValueError:
-                    LOGGER.warning(_("Received message is not JSON-encoded: %r"),
-                                   msg.content.body)
-                else:
-                    if content.get("messages"):
-                        contents.extend(content["messages"])
-                    else:
-                        contents.append(content)
+            if msg is None:
+                continue
+            body = msg.content.body
+            try:
+                content = json.loads(body)
+            except ValueError:
+                LOGGER.warning(_MSG_NOT_JSON, body)
+                continue
+            # Les lots de messages (perfs) sont mis à plat
+            batch = content.get("messages")
+            if batch:
+                contents.extend(batch)
+            else:
+                contents.append(content)
         if contents:
             d = self.processMessages(contents)
         else:
@@ -402,14 +414,30 @@ class MessageHandler(BusHandler):
                                callbackArgs=(msgs, ), errbackArgs=(msgs, ))
 
         if self.keepProducing:
-            d.addBoth(lambda _x: self.producer.resumeProducing())
+            d.addBoth(self._produceNext)
         return d
 
 
+    def _produceNext(self, _result):
+        """
+        Demande le(s) message(s) suivant(s) au producteur, une fois le
+        traitement terminé.
+        """
+        self.producer.resumeProducing()
+
+
     @defer.inlineCallbacks
     def _processList(self, msglist):
+        """
+        Traite les messages d'un lot les uns après les autres. On n'attend
+        que les traitements asynchrones, les autres s'enchaînent sans passer
+        par un C{Deferred} intermédiaire.
+        """
+        process = self.processMessage
         for msg in msglist:
-            yield defer.maybeDeferred(self.processMessage, msg)
+            result = process(msg)
+            if isinstance(result, defer.Deferred):
+                yield result
 
 
     def processMessage(self, msg):
@@ -445,6 +473,8 @@ class MessageHandler(BusHandler):
         messages sont acquittés.
         """
         self._messages_received += len(msgs)
+        # Pas d'acquittement "multiple" : le canal AMQP est partagé par tous
+        # les abonnés du client, cela acquitterait aussi leurs messages.
         ld = []
         for msg in msgs:
             ld.append(self.producer.ack(msg))
@@ -561,6 +591,20 @@ class MessageHandler(BusHandler):
 
 
 
+class _Publications(dict):
+    """
+    Table des publications : associe à un type de message le couple
+    C{(exchange, ttl)}. Un type absent de la configuration est publié dans
+    l'I{exchange} de même nom, sans durée de vie. Ce choix n'est pas
+    mémorisé : le type vient des messages reçus, la table grossirait sans
+    limite.
+    """
+
+    def __missing__(self, msg_type):
+        return (msg_type, None)
+
+
+
 class BusPublisher(BusHandler):
     """
     Gère la publication de messages
@@ -594,13 +638,13 @@ class BusPublisher(BusHandler):
         self._is_streaming = True
         if publications is None:
             publications = {}
-        self._publications = publications
+        self._publications = _Publications(publications)
         self._initialized = False
         # Stats
         self._messages_sent = 0
         # Accumulation des messages de perf
         self.batch_send_perf = batch_send_perf
-        self._batch_perf_queue = deque()
+        self._batch_perf_queue = []
 
 
     def connectionInitialized(self):
@@ -625,8 +669,6 @@ class BusPublisher(BusHandler):
         self._initialized = False
         if self.producer is not None:
             self.producer.pauseProducing()
-        if reason is None:
-            reason = Failure(Exception())
 
 
     def isConnected(self):
@@ -663,14 +705,18 @@ class BusPublisher(BusHandler):
         Méthode appelée par le producteur pour envoyer un message sur le bus.
         """
         d = self.sendMessage(data)
-        def doneSending(result):
-            """Si on a un PullProducer, on demande le message suivant"""
-            if self.producer is not None and not self._is_streaming:
-                self.producer.resumeProducing()
-            return result
-        d.addBoth(doneSending)
+        # Un PushProducer (le cas de BackupProvider) n'a pas à être relancé :
+        # inutile d'ajouter un callback pour chaque message.
+        if self.producer is not None and not self._is_streaming:
+            d.addBoth(self._doneSending)
         return d
 
+    def _doneSending(self, result):
+        """Si on a un PullProducer, on demande le message suivant"""
+        if self.producer is not None and not self._is_streaming:
+            self.producer.resumeProducing()
+        return result
+
 
     def sendMessage(self, msg):
         """
@@ -681,29 +727,48 @@ class BusPublisher(BusHandler):
         @return: le C{Deferred} avec la réponse, ou C{None} si cela n'a pas
             lieu d'être (message envoyé en push)
         """
-        self._messages_sent += 1
+        if isinstance(msg, str):
+            # Le texte reçu sera réutilisé tel quel s'il part seul sur le bus.
+            return self._sendMessageDict(json.loads(msg), msg)
         if isinstance(msg, basestring):
             msg = json.loads(msg)
-        try:
-            if isinstance(msg["timestamp"], datetime):
-                msg["timestamp"] = calendar.timegm(msg["timestamp"].utctimetuple())
-        except (KeyError, TypeError):
-            pass
+        return self._sendMessageDict(msg)
+
+
+    def _sendMessageDict(self, msg, msg_text=None):
+        """
+        Envoie sur le bus un message déjà décodé. Les appelants qui disposent
+        toujours d'un C{dict} peuvent l'utiliser directement.
+
+        @param msg: message à traiter
+        @type  msg: C{dict}
+        @param msg_text: le message déjà encodé en JSON, s'il est disponible.
+            Il est alors envoyé sans être ré-encodé, sauf si le message est
+            accumulé dans un lot de messages de performance.
+        @type  msg_text: C{str}
+        @return: le C{Deferred} avec la réponse
+        @rtype: C{Deferred}
+        """
+        self._messages_sent += 1
+        timestamp = msg.get("timestamp")
+        if isinstance(timestamp, datetime):
+            msg["timestamp"] = calendar.timegm(timestamp.utctimetuple())
         # accumulation des messages de perf
-        msg = self._accumulate_perf_msgs(msg)
-        if msg is None:
+        batch_msg = self._accumulate_perf_msgs(msg)
+        if batch_msg is None:
             return defer.succeed(None)
-        msg_text = json.dumps(msg)
+        if batch_msg is not msg or msg_text is None:
+            msg = batch_msg
+            msg_text = json.dumps(msg)
 
         msg_type = msg["type"]
-        exchange = msg_type
-        ttl = None
-        if msg_type in self._publications:
-            exchange, ttl = self._publications[msg_type]
+        exchange, ttl = self._publications[msg_type]
 
         routing_key = msg.get("routing_key", msg_type)
+        if not isinstance(routing_key, str):
+            routing_key = str(routing_key)
         persistent = msg.get("persistent", True)
-        result = self.client.send(exchange, str(routing_key), msg_text,
+        result = self.client.send(exchange, routing_key, msg_text,
                                   persistent, content_type="application/json",
                                   ttl=ttl)
         return result
@@ -715,14 +780,17 @@ class BusPublisher(BusHandler):
         limiter le nombre de messages circulant sur le bus (et donc aussi les
         acquittements correspondants)
         """
-        if self.batch_send_perf <= 1 or msg["type"] != "perf":
+        batch_size = self.batch_send_perf
+        if batch_size <= 1 or msg["type"] != "perf":
             return msg # on est pas concerné
-        self._batch_perf_queue.append(msg)
-        if len(self._batch_perf_queue) < self.batch_send_perf:
+        queue = self._batch_perf_queue
+        queue.append(msg)
+        if len(queue) < batch_size:
             return None
-        batch_msg = {"type": "perf",
-                     "messages": list(self._batch_perf_queue)}
-        self._batch_perf_queue.clear()
+        # La liste accumulée est transmise telle quelle (sans copie), on en
+        # démarre une nouvelle pour le lot suivant.
+        batch_msg = {"type": "perf", "messages": queue}
+        self._batch_perf_queue = []
         #LOGGER.info("Sent a batch perf message with %d messages",
         #            self.batch_send_perf)
         return batch_msg
@@ -777,11 +845,8 @@ class BackupProvider(Service):
 
 
     def _build_queue(self):
-        if self.max_queue_size is not None:
-            self.queue = deque(maxlen=self.max_queue_size)
-        else:
-            # sur python < 2.6, il n'y a pas de maxlen
-            self.queue = deque()
+        # maxlen=None : pas de limite
+        self.queue = deque(maxlen=self.max_queue_size)
 
 
     def startService(self):
@@ -826,7 +891,11 @@ class BackupProvider(Service):
             self.stat_names["backup_in_buf"]: len(self.retry.buffer_in),
             self.stat_names["backup_out_buf"]: len(self.retry.buffer_out),
             }
-        backup_size_d = self.retry.qsize()
+        if self.retry.isEmpty():
+            # Inutile d'interroger la base SQLite pour la compter.
+            backup_size_d = defer.succeed(0)
+        else:
+            backup_size_d = self.retry.qsize()
         def add_backup_size(backup_size):
             stats[ self.stat_names["backup"] ] = backup_size
             return stats
@@ -838,7 +907,10 @@ class BackupProvider(Service):
     def write(self, data):
         """Méthode appelée par le producteur pour transférer un message."""
         self.queue.append(data)
-        self.processQueue()
+        # Si la file est déjà en cours de traitement, le message sera dépilé
+        # par la boucle en cours : inutile de relancer processQueue().
+        if not self._processing_queue:
+            self.processQueue()
 
 
     def pauseProducing(self):
@@ -883,22 +955,26 @@ class BackupProvider(Service):
             return
 
         self._processing_queue = True
+        # Références locales pour limiter les accès aux attributs dans la
+        # boucle, exécutée pour chaque message.
+        get_next_msg = self._getNextMsg
+        write = self.consumer.write
+        send_failed = self._send_failed
         while True:
-            msg = yield self._getNextMsg()
+            msg = yield get_next_msg()
             if msg is None:
                 break
             try:
-                yield self.consumer.write(msg)
+                yield write(msg)
             except Exception as e: # pylint: disable-msg=W0703
                 # W0703: Catch "Exception"
-                self._send_failed(e, msg)
+                send_failed(e, msg)
         self._processing_queue = False
 
 
     def _send_failed(self, e, msg):
         """errback: remet le message en base"""
-        errmsg = _('Requeuing message (%(reason)s).')
-        LOGGER.info(errmsg % {
+        LOGGER.info(_MSG_REQUEUING % {
             "reason": get_error_message(e),
         })
         self.queue.append(msg)
@@ -906,33 +982,39 @@ class BackupProvider(Service):
 
     def _saveToDb(self):
         """Sauvegarde tous les messages de la file dans la base de backup."""
+        if not self.queue:
+            return defer.succeed(None)
         def eb(f):
             LOGGER.error(_("Error trying to save a message to the backup "
                            "database: %s"), get_error_message(f.value))
-        saved = []
-        while len(self.queue) > 0:
-            msg = self.queue.popleft()
-            d = self.retry.put(json.dumps(msg))
-            d.addErrback(eb)
-            saved.append(d)
-        return defer.gatherResults(saved)
+        # La file est transmise en un seul lot, sérialisé par DbRetry.
+        msgs = list(self.queue)
+        self.queue.clear()
+        d = self.retry.put_many(msgs)
+        d.addErrback(eb)
+        return d
 
     def _getNextMsg(self):
         """
         Récupère le prochain message à traiter, en commençant par essayer dans
         la base de backup (L{retry}).
         """
-        d = self.retry.pop()
         def get_from_queue(msg):
             if msg is not None:
-                return json.loads(msg) # le backup est prioritaire
+                # le backup est prioritaire. Les messages enregistrés un par
+                # un (DbRetry.put) peuvent ne pas avoir été sérialisés.
+                if isinstance(msg, basestring):
+                    msg = json.loads(msg)
+                return msg
             # on dépile la file principale
-            try:
-                msg = self.queue.popleft()
-            except IndexError:
+            if not self.queue:
                 # plus de messages
                 return None
-            return msg
+            return self.queue.popleft()
+        if self.retry.isEmpty():
+            # Cas nominal : rien en backup, inutile de passer par la base.
+            return defer.succeed(get_from_queue(None))
+        d = self.retry.pop()
         d.addCallback(get_from_queue)
         return d
 
@@ -975,11 +1057,6 @@ def backupprovider_factory(settings, producer=None):
         max_queue_size = 0
     if max_queue_size <= 0:
         max_queue_size = None
-    if (max_queue_size is not None and
-                tuple(python_version_tuple()) < ('2', '6')):
-        LOGGER.warning(_("The max_queue_size option is only available "
-                         "on Python >= 2.6. Ignoring."))
-        max_queue_size = None
 
     # Base de backup
     bkpfile = settings['connector'].get('backup_file', ":memory:")
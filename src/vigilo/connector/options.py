@@ -78,12 +78,31 @@ def make_options(module):
     return _inner
 
 
+# Origine de la configuration actuellement chargée : un couple
+# (fichier, date de modification) ou (module, None).
+_SETTINGS_SOURCE = None
+
 def getSettings(options, module):
+    """
+    Charge la configuration du connecteur. Elle n'est relue que si sa
+    source a changé depuis le dernier chargement.
+    """
+    global _SETTINGS_SOURCE # pylint: disable-msg=W0603
     from vigilo.common.conf import settings
     if options["config"] is not None:
-        settings.load_file(options["config"])
+        try:
+            source = (options["config"], os.path.getmtime(options["config"]))
+        except OSError:
+            # Fichier absent ou illisible : load_file() gère l'erreur.
+            source = None
     else:
-        settings.load_module(module)
+        source = (module, None)
+    if source is None or source != _SETTINGS_SOURCE:
+        if options["config"] is not None:
+            settings.load_file(options["config"])
+        else:
+            settings.load_module(module)
+        _SETTINGS_SOURCE = source
     # On propage l'identifiant de l'instance via les settings.
     settings["instance"] = options["id"]
     return settings
@@ -12,6 +12,8 @@ LOGGER = get_logger(__name__)
 from vigilo.common.gettext import translate
 _ = translate(__name__)
 
+_MSG_UNKNOWN_TYPE = _("Unknown/malformed message type: '%s'")
+
 
 def parseMessage(text):
     """
@@ -44,58 +46,66 @@ def parseMessage(text):
         return msg_dict
 
     except (TypeError, AttributeError, IndexError):
-        LOGGER.warning(_("Unknown/malformed message type: '%s'") %
-                       elements[0])
+        LOGGER.warning(_MSG_UNKNOWN_TYPE, elements[0])
         return None
 
 
 def msg2dict(elements):
     msg_type = elements[0]
-    d = {
-        "type": msg_type,
-        "timestamp": elements[1],
-    }
-
     size = len(elements)
     if msg_type == "event" and 6 <= size <= 7:
-        d["host"] = elements[2]
+        d = {
+            "type": msg_type,
+            "timestamp": elements[1],
+            "host": elements[2],
+            "state": elements[4],
+            "message": elements[5],
+        }
         if elements[3] and elements[3].lower() != "host":
             d["service"] = elements[3]
-        d["state"] = elements[4]
-        d["message"] = elements[5]
         if size == 7 and elements[6]:
             d["routing_key"] = elements[6]
 
     elif msg_type == "perf" and 5 <= size <= 6:
-        d["host"] = elements[2]
-        d["datasource"] = elements[3]
-        d["value"] = elements[4]
+        d = {
+            "type": msg_type,
+            "timestamp": elements[1],
+            "host": elements[2],
+            "datasource": elements[3],
+            "value": elements[4],
+        }
         if size == 6 and elements[5]:
             d["routing_key"] = elements[5]
 
     elif msg_type == "nagios" and size >= 3:
-        d["cmdname"] = elements[2]
-        d["value"] = ";".join(elements[3:])
+        cmdname = elements[2]
+        d = {
+            "type": msg_type,
+            "timestamp": elements[1],
+            "cmdname": cmdname,
+            "value": ";".join(elements[3:]),
+        }
         #d["routing_key"] = "all"
-        if (d["cmdname"].startswith("PROCESS_")
-                and d["cmdname"].endswith("_CHECK_RESULT")):
+        if cmdname.startswith("PROCESS_") and cmdname.endswith("_CHECK_RESULT"):
             d["host"] = elements[3]
 
     elif msg_type == "state" and 9 <= size <= 10:
-        d["host"] = elements[2]
-        d["ip"] = elements[3]
-        d["service"] = elements[4]
-        d["code"] = elements[5]
-        d["statetype"] = elements[6]
-        d["attempt"] = elements[7]
-        d["message"] = elements[8]
+        d = {
+            "type": msg_type,
+            "timestamp": elements[1],
+            "host": elements[2],
+            "ip": elements[3],
+            "service": elements[4],
+            "code": elements[5],
+            "statetype": elements[6],
+            "attempt": elements[7],
+            "message": elements[8],
+        }
         if size == 10 and elements[9]:
             d["routing_key"] = elements[9]
 
     else:
-        LOGGER.warning(_("Unknown/malformed message type: '%s'") %
-                       msg_type)
+        LOGGER.warning(_MSG_UNKNOWN_TYPE, msg_type)
         return None
 
     return d
-
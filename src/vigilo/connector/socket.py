@@ -21,6 +21,8 @@ LOGGER = get_logger(__name__)
 
 from vigilo.connector.serialize import parseMessage
 
+_MSG_UNPARSABLE = _("Unparsable line: %s")
+
 
 
 class VigiloLineReceiver(LineReceiver):
@@ -37,7 +39,7 @@ class VigiloLineReceiver(LineReceiver):
 
         msg = parseMessage(line)
         if msg is None:
-            LOGGER.warning(_("Unparsable line: %s"), line)
+            LOGGER.warning(_MSG_UNPARSABLE, line)
             # Couldn't parse this line
             return
 
@@ -26,6 +26,23 @@ from vigilo.connector import json
 
 
 
+def _serialize(msg):
+    """
+    Sérialise en JSON un message encore sous forme de C{dict}.
+    @return: le message sérialisé, ou C{None} s'il ne peut pas l'être (il
+        est alors journalisé et abandonné, pour ne pas bloquer le reste)
+    """
+    if not isinstance(msg, dict):
+        return msg
+    try:
+        return json.dumps(msg)
+    except (TypeError, ValueError) as e:
+        LOGGER.error(_("Could not serialize a message for the backup "
+                       "database, dropping it: %s"), e)
+        return None
+
+
+
 class DbRetry(object):
     """
     Implémente une base de données locale qui peut-être utilisée pour stocker
@@ -56,7 +73,26 @@ class DbRetry(object):
         self._db = None
         # threads: http://twistedmatrix.com/trac/ticket/3629
         self._db = adbapi.ConnectionPool("sqlite3.dbapi2", filename,
-                                         check_same_thread=False)
+                                         check_same_thread=False,
+                                         cp_openfun=self._open_connection)
+
+
+    @staticmethod
+    def _open_connection(conn):
+        """
+        Configure chaque nouvelle connexion à la base :
+         - les messages sont relus sous forme d'octets (tels qu'encodés en
+           JSON), sans passer par un décodage UTF-8 en C{unicode} ;
+         - le journal WAL évite une synchronisation sur disque à chaque
+           transaction (ignoré par les versions de SQLite antérieures à
+           3.7.0) ; la base reste cohérente en cas d'arrêt brutal.
+        """
+        conn.text_factory = str
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 
 
 
@@ -104,7 +140,10 @@ class DbRetry(object):
         """
         def get_from_buffer_out():
             while len(self.buffer_out) > 0:
-                yield self.buffer_out.popleft()
+                msg_id, msg = self.buffer_out.popleft()
+                msg = _serialize(msg)
+                if msg is not None:
+                    yield (msg_id, msg)
         if self.buffer_out:
             try:
                 txn.executemany("INSERT INTO %s VALUES (?, ?)"
@@ -116,10 +155,9 @@ class DbRetry(object):
             self._cache_isempty = False
         def get_from_buffer_in():
             while len(self.buffer_in) > 0:
-                msg = self.buffer_in.popleft()
-                if isinstance(msg, dict):
-                    msg = json.dumps(msg)
-                yield (msg, )
+                msg = _serialize(self.buffer_in.popleft())
+                if msg is not None:
+                    yield (msg, )
         if self.buffer_in:
             txn.executemany("INSERT INTO %s VALUES (null, ?)" % self._table,
                             get_from_buffer_in())
@@ -140,6 +178,17 @@ class DbRetry(object):
         return d
 
 
+    def isEmpty(self):
+        """
+        Indique, sans requête SQL, qu'aucun message n'est en attente : ni en
+        base, ni dans les buffers, ni en cours d'écriture.
+        @rtype: C{bool}
+        """
+        return (self._cache_isempty and not self._saving_buffer_in
+                and self._is_flushing_d is None
+                and not self.buffer_in and not self.buffer_out)
+
+
     # -- Récupération depuis la base
 
     def get(self):
@@ -263,6 +312,27 @@ class DbRetry(object):
             return defer.succeed(None)
 
 
+    def put_many(self, msgs):
+        """
+        Enregistre une liste de messages en base, comme L{append} mais avec
+        un seul C{Deferred} et au plus une transaction SQLite pour le lot.
+        Les messages sont sérialisés dès maintenant : ce qui est sauvegardé ne
+        dépend plus des objets de l'appelant, et un message invalide est
+        écarté sans compromettre le reste du lot.
+        @param msgs: messages à enregistrer
+        @type  msgs: C{list}
+        @rtype: C{Deferred}
+        """
+        for msg in msgs:
+            msg = _serialize(msg)
+            if msg is not None:
+                self.buffer_in.append(msg)
+        if len(self.buffer_in) > self._buffer_in_max:
+            return self._db.runInteraction(self._save_buffer_in)
+        else:
+            return defer.succeed(None)
+
+
     def _save_buffer_in(self, txn):
         """
         Enregistre en base SQLite la totalité du buffer d'entrée. Un lock
@@ -279,10 +349,9 @@ class DbRetry(object):
         self._saving_buffer_in = True
         def get_from_buffer_in():
             while len(self.buffer_in) > 0:
-                msg = self.buffer_in.popleft()
-                if isinstance(msg, dict):
-                    msg = json.dumps(msg)
-                yield (msg, )
+                msg = _serialize(self.buffer_in.popleft())
+                if msg is not None:
+                    yield (msg, )
         try:
             txn.executemany("INSERT INTO %s VALUES (null, ?)" % self._table,
                             get_from_buffer_in())
@@ -291,5 +360,6 @@ class DbRetry(object):
         else:
             LOGGER.debug("Saved %d messages from the input buffer", total)
             self._cache_isempty = False
-        self._saving_buffer_in = False
+        finally:
+            self._saving_buffer_in = False
 
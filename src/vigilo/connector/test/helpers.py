@@ -115,9 +115,29 @@ class ConsumerStub(object):
     def __init__(self):
         self.written = []
         self.connected = True
+        self._waiting = []
 
     def write(self, data):
         self.written.append(data)
+        count = len(self.written)
+        waiting = self._waiting
+        self._waiting = []
+        for expected, d in waiting:
+            if count >= expected:
+                d.callback(self.written)
+            else:
+                self._waiting.append((expected, d))
+
+    def waitForWrites(self, count):
+        """
+        Renvoie un C{Deferred} déclenché dès que C{count} messages ont été
+        écrits, plutôt que d'attendre un délai fixe.
+        """
+        if len(self.written) >= count:
+            return defer.succeed(self.written)
+        d = defer.Deferred()
+        self._waiting.append((count, d))
+        return d
 
     def isConnected(self):
         return self.connected
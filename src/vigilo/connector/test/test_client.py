@@ -20,6 +20,22 @@ from vigilo.connector.client import client_factory, oneshotclient_factory
 from vigilo.connector.client import VigiloClient
 from vigilo.connector.client import split_host_port
 
+
+def make_settings(**sections):
+    """
+    Construit une configuration minimale pour les tests : identifiants du
+    bus, complétés par les sections données en paramètre.
+    """
+    settings = ConfigObj()
+    settings["bus"] = {
+            "user": "test",
+            "password": "test",
+            }
+    for name, values in sections.iteritems():
+        settings[name] = values
+    return settings
+
+
 class MSCTestCase(unittest.TestCase):
     """Teste L{MultipleServerConnector}"""
 
@@ -58,75 +74,56 @@ class MSCTestCase(unittest.TestCase):
 
 
 
+@mock.patch("twisted.internet.reactor.connectTCP")
 class VCTestCase(unittest.TestCase):
 
     def setUp(self):
-        self.settings = ConfigObj()
-        self.settings["bus"] = {
-                "user": "test",
-                "password": "test",
-                }
-
-    #@mock.patch("twisted.internet.reactor.stop")
-    #@mock.patch("twisted.internet.reactor.run")
-    @mock.patch("twisted.internet.reactor.connectTCP")
-    #def test_host_no_port(self, mockedConnectTCP, mockedRun, mockedStop):
-    def test_host_no_port(self, mockedConnectTCP):
-        self.settings["bus"]["hosts"] = "testhost"
+        self.settings = make_settings()
+
+    def _connect(self, hosts):
+        self.settings["bus"]["hosts"] = hosts
         vc = client_factory(self.settings)
         vc._getConnection()
+
+    def test_host_no_port(self, mockedConnectTCP):
+        self._connect("testhost")
         self.assertEqual(mockedConnectTCP.call_count, 1)
         self.assertEqual(mockedConnectTCP.call_args[0][:2], ("testhost", 5672))
 
-    #@mock.patch("twisted.internet.reactor.stop")
-    #@mock.patch("twisted.internet.reactor.run")
-    @mock.patch("twisted.internet.reactor.connectTCP")
-    #def test_host_and_port(self, mockedConnectTCP, mockedRun, mockedStop):
     def test_host_and_port(self, mockedConnectTCP):
-        self.settings["bus"]["hosts"] = "testhost:5333"
-        vc = client_factory(self.settings)
-        vc._getConnection()
+        self._connect("testhost:5333")
         self.assertEqual(mockedConnectTCP.call_count, 1)
         self.assertEqual(mockedConnectTCP.call_args[0][:2], ("testhost", 5333))
 
 
 
+@mock.patch("twisted.internet.reactor.stop")
+@mock.patch("twisted.internet.reactor.run")
+@mock.patch("twisted.internet.reactor.connectTCP")
 class OSCTestCase(unittest.TestCase):
     """
     Teste les méthodes de connexion en fonction de la configuration fournie
     """
 
     def setUp(self):
-        self.settings = ConfigObj()
-        self.settings["bus"] = {
-                "user": "test",
-                "password": "test",
-                }
-        self.settings["connector"] = {
+        self.settings = make_settings(connector={
                 "lock_file": "/nonexistant",
-                }
+                })
 
-    @mock.patch("twisted.internet.reactor.stop")
-    @mock.patch("twisted.internet.reactor.run")
-    @mock.patch("twisted.internet.reactor.connectTCP")
-    def test_host_no_port(self, mockedConnectTCP, mockedRun, mockedStop):
-        self.settings["bus"]["hosts"] = "testhost"
+    def _run(self, hosts):
+        self.settings["bus"]["hosts"] = hosts
         osc = oneshotclient_factory(self.settings)
         osc.create_lockfile = mock.Mock()
         osc.create_lockfile.return_value = False
         osc.run()
+
+    def test_host_no_port(self, mockedConnectTCP, mockedRun, mockedStop):
+        self._run("testhost")
         self.assertEqual(mockedConnectTCP.call_count, 1)
         self.assertEqual(mockedConnectTCP.call_args[0][:2], ("testhost", 5672))
 
-    @mock.patch("twisted.internet.reactor.stop")
-    @mock.patch("twisted.internet.reactor.run")
-    @mock.patch("twisted.internet.reactor.connectTCP")
     def test_host_and_port(self, mockedConnectTCP, mockedRun, mockedStop):
-        self.settings["bus"]["hosts"] = "testhost:5333"
-        osc = oneshotclient_factory(self.settings)
-        osc.create_lockfile = mock.Mock()
-        osc.create_lockfile.return_value = False
-        osc.run()
+        self._run("testhost:5333")
         self.assertEqual(mockedConnectTCP.call_count, 1)
         self.assertEqual(mockedConnectTCP.call_args[0][:2], ("testhost", 5333))
 
@@ -145,7 +142,6 @@ class VigiloClientTestCase(unittest.TestCase):
         def check(r):
             self.assertTrue(c.channel.basic_publish.called)
             args = c.channel.basic_publish.call_args_list[0][1]
-            print(args)
             self.assertTrue("delivery-mode" in args["content"].properties)
             self.assertEqual(args["content"].properties["delivery-mode"], 2)
             self.assertEqual(args["content"].body, "msg")
@@ -166,7 +162,6 @@ class VigiloClientTestCase(unittest.TestCase):
         def check(r):
             self.assertTrue(c.channel.basic_publish.called)
             args = c.channel.basic_publish.call_args_list[0][1]
-            print(args)
             self.assertTrue("delivery-mode" in args["content"].properties)
             self.assertEqual(args["content"].properties["delivery-mode"], 1)
         d.addCallback(check)
@@ -103,7 +103,6 @@ class ConfDBTest(unittest.TestCase):
         new_connection_threads = set(self.confdb._db.connections.keys())
         self.assertFalse(self.confdb._db.close.called)
         self.assertFalse(self.confdb._db.start.called)
-        print(old_connection_threads, new_connection_threads)
         self.assertTrue(old_connection_threads <= new_connection_threads)
 
 
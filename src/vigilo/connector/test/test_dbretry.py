@@ -28,6 +28,7 @@ from nose.twistedtools import deferred
 
 from twisted.internet import defer
 from vigilo.connector.store import DbRetry
+from vigilo.connector import json
 from vigilo.connector.test.helpers import ConnectionPoolStub, wait
 
 
@@ -49,6 +50,10 @@ class TestDbRetry(unittest.TestCase):
     def tearDown(self):
         del self.db
         os.remove(self.db_path)
+        # fichiers du journal WAL
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
 
 
     @deferred(timeout=30)
@@ -104,6 +109,62 @@ class TestDbRetry(unittest.TestCase):
         backup_size = yield self.db.qsize()
         self.assertEqual(backup_size, self.db._buffer_in_max + 1)
 
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_put_many(self):
+        """
+        Teste l'enregistrement d'un lot de messages
+        """
+        xml = '<abc foo="bar">def</abc>'
+        yield self.db.put_many([xml] * 2)
+        self.assertEqual(len(self.db.buffer_in), 2)
+        yield self.db.put_many([xml] * self.db._buffer_in_max)
+        self.assertEqual(len(self.db.buffer_in), 0)
+        backup_size = yield self.db.qsize()
+        self.assertEqual(backup_size, self.db._buffer_in_max + 2)
+
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_put_many_serialized(self):
+        """
+        Un lot est sérialisé à l'enregistrement : un message invalide est
+        écarté seul, et une modification ultérieure n'a pas d'effet
+        """
+        msgs = [{"type": "perf", "value": "1"},
+                {"type": "perf", "value": set()},
+                {"type": "perf", "value": "2"}]
+        yield self.db.put_many(msgs)
+        msgs[0]["value"] = "modified"
+        self.assertEqual(len(self.db.buffer_in), 2)
+        yield self.db.flush()
+        self.assertFalse(self.db._saving_buffer_in)
+        backup_size = yield self.db.qsize()
+        self.assertEqual(backup_size, 2)
+        for value in ("1", "2"):
+            msg = yield self.db.get()
+            self.assertEqual(json.loads(msg), {"type": "perf", "value": value})
+
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_unserializable(self):
+        """
+        Un message non sérialisable est abandonné sans bloquer la sauvegarde
+        des autres messages
+        """
+        self.db.put({"type": "perf", "value": "1"})
+        self.db.put({"type": "perf", "value": set()})
+        self.db.put({"type": "perf", "value": "2"})
+        yield self.db._db.runInteraction(self.db._save_buffer_in)
+        self.assertFalse(self.db._saving_buffer_in)
+        self.assertEqual(len(self.db.buffer_in), 0)
+        backup_size = yield self.db.qsize()
+        self.assertEqual(backup_size, 2)
+        # Les sauvegardes suivantes fonctionnent toujours
+        self.db.put({"type": "perf", "value": "3"})
+        yield self.db.flush()
+        backup_size = yield self.db.qsize()
+        self.assertEqual(backup_size, 3)
+
     @deferred(timeout=30)
     @defer.inlineCallbacks
     def test_get_buffer(self):
@@ -137,6 +198,33 @@ class TestDbRetry(unittest.TestCase):
         backup_size = yield self.db.qsize()
         self.assertEqual(backup_size, msg_count * 2)
 
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_is_empty(self):
+        """
+        L'état vide de la base est connu sans requête SQL
+        """
+        self.assertTrue(self.db.isEmpty())
+        yield self.db.put('<abc foo="bar">def</abc>')
+        self.assertFalse(self.db.isEmpty())
+        yield self.db.flush()
+        self.assertFalse(self.db.isEmpty())
+        yield self.db.get()
+        yield self.db.get()
+        self.assertTrue(self.db.isEmpty())
+
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_read_as_bytes(self):
+        """
+        Les messages sont relus de la base sans décodage en unicode
+        """
+        yield self.db.put({"type": "perf", "value": u"\u00e9"})
+        yield self.db.flush()
+        msg = yield self.db.get()
+        self.assertTrue(isinstance(msg, str))
+        self.assertEqual(json.loads(msg), {"type": "perf", "value": u"\u00e9"})
+
     @deferred(timeout=30)
     @defer.inlineCallbacks
     def test_vacuum(self):
@@ -158,7 +246,6 @@ class TestDbRetry(unittest.TestCase):
 
         # On attend un peu, le VACUUM est décalé
         yield wait(1)
-        print(stub.requests)
         self.assertEqual( (("VACUUM", ), {}), stub.requests.pop() )
 
     @deferred(timeout=30)
@@ -26,7 +26,7 @@ from mock import Mock
 from twisted.internet import defer
 
 from vigilo.connector.handlers import BackupProvider, BusPublisher
-from vigilo.connector.handlers import QueueSubscriber
+from vigilo.connector.handlers import QueueSubscriber, MessageHandler
 from vigilo.connector import json
 
 from vigilo.connector.test.helpers import ClientStub, wait, ConsumerStub
@@ -40,18 +40,25 @@ class BackupProviderTestCase(unittest.TestCase):
     """Teste la sauvegarde locale de messages en cas d'erreur."""
 
 
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix="test-connector-")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
     @deferred(timeout=30)
     def setUp(self):
-        self.tmpdir = tempfile.mkdtemp(prefix="test-connector-")
-        self.base = os.path.join(self.tmpdir, "backup.sqlite")
+        # une base par test, dans le répertoire partagé par la classe
+        self.base = os.path.join(self.tmpdir,
+                                 "%s.sqlite" % self._testMethodName)
         self.bp = BackupProvider(self.base, "tobus")
         return self.bp.startService()
 
     @deferred(timeout=30)
     def tearDown(self):
-        d = self.bp.stopService()
-        d.addCallback(lambda _x: shutil.rmtree(self.tmpdir))
-        return d
+        return self.bp.stopService()
 
 
     @deferred(timeout=30)
@@ -82,14 +89,13 @@ class BackupProviderTestCase(unittest.TestCase):
         self.assertEqual(backup_size, 1)
         # On se connecte
         self.bp.resumeProducing()
-        # On attend un peu
-        yield wait(0.5)
+        # On attend que le message sauvegardé soit envoyé
+        yield consumer.waitForWrites(1)
         # On en envoie un deuxième
         msg2 = {"type": "perf", "value": "2"}
         self.bp.queue.append(msg2)
         yield self.bp.processQueue()
-        # On attend un peu
-        yield wait(0.5)
+        yield consumer.waitForWrites(2)
         # On vérifie que les deux messages ont bien été envoyés dans le bon
         # ordre
         self.assertEqual(len(consumer.written), 2)
@@ -114,6 +120,32 @@ class BackupProviderTestCase(unittest.TestCase):
             next_msg = yield self.bp._getNextMsg()
             self.assertEqual(next_msg, msg)
 
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_empty_backup_not_queried(self):
+        """La base de backup vide n'est pas interrogée"""
+        msg = {"type": "perf", "value": "1"}
+        self.bp.retry.pop = Mock()
+        self.bp.queue.append(msg)
+        next_msg = yield self.bp._getNextMsg()
+        self.assertTrue(next_msg is msg)
+        self.assertFalse(self.bp.retry.pop.called)
+
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_backup_buffer_snapshot(self):
+        """
+        Un message mis en backup n'est plus affecté par les modifications
+        ultérieures de l'objet d'origine
+        """
+        msg = {"type": "perf", "value": "1"}
+        self.bp.paused = True
+        self.bp.queue.append(msg)
+        yield self.bp.processQueue()
+        msg["value"] = "modified"
+        next_msg = yield self.bp._getNextMsg()
+        self.assertEqual(next_msg, {"type": "perf", "value": "1"})
+
     @deferred(timeout=30)
     @defer.inlineCallbacks
     def test_save_to_db(self):
@@ -153,15 +185,10 @@ class BackupProviderTestCase(unittest.TestCase):
         # on vide les buffers (pour fiabiliser le test)
         yield self.bp.retry.flush()
         backup_size = yield self.bp.retry.qsize()
-        print(self.bp.retry._cache_isempty,
-              len(self.bp.retry.buffer_in),
-              len(self.bp.retry.buffer_out),
-              len(consumer.written), backup_size)
         LOGGER.debug("Beginning assertions")
         self.assertEqual(backup_size, 20)
         self.assertEqual(len(consumer.written), 10)
         stats = yield self.bp.getStats()
-        print(stats)
         self.assertEqual(stats, {
             "queue": 0,
             "backup": 20,
@@ -170,6 +197,16 @@ class BackupProviderTestCase(unittest.TestCase):
             })
 
 
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_stats_empty_backup(self):
+        """La base de backup vide n'est pas interrogée pour les stats"""
+        self.bp.retry.qsize = Mock()
+        stats = yield self.bp.getStats()
+        self.assertFalse(self.bp.retry.qsize.called)
+        self.assertEqual(stats["backup"], 0)
+
+
 
 class BusPublisherTestCase(unittest.TestCase):
 
@@ -197,11 +234,40 @@ class BusPublisherTestCase(unittest.TestCase):
         # on en envoie un de plus, ce qui doit envoyer un message accumulé
         self.bp.write(msg)
         self.assertEqual(len(output), 1)
-        print(repr(output[0]))
         sent = json.loads(output[0]["content"].body)
         self.assertEqual(len(sent["messages"]), count)
 
 
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_publications(self):
+        """Choix de l'exchange selon le type de message"""
+        bp = BusPublisher({"perf": ("perf-exchange", 42000)})
+        bp.setClient(self.bp.client)
+        bp.client.stub_connect()
+        output = bp.client.channel.sent
+        yield bp.write({"type": "perf", "value": "dummy"})
+        yield bp.write({"type": "event", "value": "dummy"})
+        self.assertEqual(output[0]["exchange"], "perf-exchange")
+        self.assertEqual(output[0]["content"]["expiration"], "42000")
+        self.assertEqual(output[1]["exchange"], "event")
+        self.assertFalse("expiration" in output[1]["content"].properties)
+        # Les types non configurés ne sont pas ajoutés à la table
+        self.assertEqual(bp._publications.keys(), ["perf"])
+
+
+    @deferred(timeout=30)
+    @defer.inlineCallbacks
+    def test_send_text_as_is(self):
+        """Un message reçu sous forme de texte est envoyé sans ré-encodage"""
+        self.bp.client.stub_connect()
+        output = self.bp.client.channel.sent
+        msg_text = '{"type":  "event", "value": "dummy"}'
+        yield self.bp.write(msg_text)
+        self.assertEqual(output[0]["exchange"], "event")
+        self.assertEqual(output[0]["content"].body, msg_text)
+
+
     def test_on_connect(self):
         """À la connexion, on demande des données à l'émetteur"""
         producer = Mock()
@@ -244,10 +310,67 @@ class QueueSubscriberTestCase(unittest.TestCase):
 
         def check(r):
             print("verification")
-            print(self.qs.consumer.write.call_args_list)
             self.assertTrue(self.qs.consumer.write.called,
                     "la fonction write() n'a pas été appelée")
             self.assertEqual("dummy message",
                     self.qs.consumer.write.call_args_list[0][0][0])
         self.qs.ready.addCallback(check)
         return self.qs.ready
+
+
+
+class MessageHandlerTestCase(unittest.TestCase):
+
+
+    def setUp(self):
+        self.mh = MessageHandler()
+        self.mh.producer = Mock()
+
+
+    def test_batch_ack_shared_channel(self):
+        """Un lot acquitté ne doit pas acquitter les messages d'un autre abonné"""
+        client = ClientStub("testhostname", None, None)
+        subscribers = []
+        for queue_name in ("queue1", "queue2"):
+            qs = QueueSubscriber(queue_name, 0)
+            qs.setClient(client)
+            subscribers.append(qs)
+        client.stub_connect()
+        # Les deux abonnés partagent le canal du client
+        self.assertTrue(subscribers[0]._channel is subscribers[1]._channel)
+        self.mh.producer = subscribers[1]
+        msgs = []
+        # Messages entrelacés : 1 et 3 pour le premier abonné (non traités),
+        # 2 et 4 pour le second.
+        for tag in (2, 4):
+            msg = Mock()
+            msg.delivery_tag = tag
+            msgs.append(msg)
+        del client.channel.sent[:]
+        self.mh.processingBatchSucceeded(None, msgs)
+        acks = [(sent["delivery_tag"], sent["multiple"])
+                for sent in client.channel.sent
+                if sent["method"] == "basic_ack"]
+        self.assertEqual(acks, [(2, False), (4, False)])
+        self.assertEqual(self.mh._messages_received, 2)
+
+    def test_write_batch_flatten(self):
+        """Les lots de messages reçus sont mis à plat avant traitement"""
+        self.mh.processMessages = Mock(return_value=defer.succeed(None))
+        bodies = [
+            json.dumps({"type": "event", "value": "1"}),
+            "not JSON",
+            json.dumps({"type": "perf", "messages": [
+                {"type": "perf", "value": "2"},
+                {"type": "perf", "value": "3"},
+            ]}),
+        ]
+        msgs = []
+        for tag, body in enumerate(bodies):
+            msg = Mock()
+            msg.delivery_tag = tag
+            msg.content.body = body
+            msgs.append(msg)
+        self.mh.write_batch(msgs)
+        contents = self.mh.processMessages.call_args[0][0]
+        self.assertEqual([c["value"] for c in contents], ["1", "2", "3"])
@@ -3,10 +3,14 @@
 # Copyright (C) 2006-2020 CS GROUP - France
 # License: GNU GPL v2 <http://www.gnu.org/licenses/gpl-2.0.html>
 
+import os
+import tempfile
 import unittest
 
+import mock
 
-from vigilo.connector.options import parsePublications
+from vigilo.connector import options
+from vigilo.connector.options import parsePublications, getSettings
 
 class OptionTestCase(unittest.TestCase):
     """Teste L{options.parsePublications}"""
@@ -45,3 +49,42 @@ class OptionTestCase(unittest.TestCase):
         publications = { "un":  ":"}
         self.assertRaises(ValueError, parsePublications, publications)
 
+
+
+
+class GetSettingsTestCase(unittest.TestCase):
+    """Teste L{options.getSettings}"""
+
+    def setUp(self):
+        options._SETTINGS_SOURCE = None
+        conf_h, self.conf = tempfile.mkstemp(suffix=".ini")
+        os.close(conf_h)
+
+    def tearDown(self):
+        os.remove(self.conf)
+
+    @mock.patch("vigilo.common.conf.settings")
+    def test_cache(self, mock_settings):
+        """La configuration n'est pas relue si le fichier n'a pas changé"""
+        getSettings({"config": self.conf, "id": 1}, "vigilo.connector")
+        getSettings({"config": self.conf, "id": 2}, "vigilo.connector")
+        self.assertEqual(mock_settings.load_file.call_count, 1)
+        mock_settings.__setitem__.assert_called_with("instance", 2)
+
+    @mock.patch("vigilo.common.conf.settings")
+    def test_cache_modified(self, mock_settings):
+        """La configuration est relue si le fichier a changé"""
+        getSettings({"config": self.conf, "id": 1}, "vigilo.connector")
+        mtime = os.path.getmtime(self.conf)
+        os.utime(self.conf, (mtime + 10, mtime + 10))
+        getSettings({"config": self.conf, "id": 1}, "vigilo.connector")
+        self.assertEqual(mock_settings.load_file.call_count, 2)
+
+    @mock.patch("vigilo.common.conf.settings")
+    def test_missing_file(self, mock_settings):
+        """Un fichier absent est confié à load_file, sans mise en cache"""
+        missing = self.conf + ".missing"
+        getSettings({"config": missing, "id": 1}, "vigilo.connector")
+        getSettings({"config": missing, "id": 1}, "vigilo.connector")
+        self.assertEqual(mock_settings.load_file.call_args_list,
+                         [((missing, ), {}), ((missing, ), {})])
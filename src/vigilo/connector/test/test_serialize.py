@@ -54,6 +54,11 @@ class SerializeTestCase(unittest.TestCase):
                 }
         self.assertEqual(expected, parseMessage(message))
 
+    def test_event_too_many_fields(self):
+        """Un évènement avec trop d'éléments est rejeté"""
+        message = "event|1165939739|host|service|OK|message|key|extra"
+        self.assertEqual(None, parseMessage(message))
+
 
     def test_perf(self):
         """Conversion d'un message de perf"""
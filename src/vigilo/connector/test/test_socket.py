@@ -20,8 +20,6 @@ import unittest
 from nose.twistedtools import reactor  # pylint: disable-msg=W0611
 from nose.twistedtools import deferred
 
-from twisted.internet import defer
-
 from vigilo.connector.socket import SocketListener
 
 from vigilo.connector.test.helpers import ConsumerStub
@@ -50,18 +48,25 @@ class SendingFactory(ClientFactory):
 class SocketListenerTestCase(unittest.TestCase):
 
 
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix="test-connector-")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
     @deferred(timeout=30)
     def setUp(self):
-        self.tmpdir = tempfile.mkdtemp(prefix="test-connector-")
-        self.socket = os.path.join(self.tmpdir, "sl.sock")
+        # un socket par test, pour ne pas dépendre de sa suppression
+        self.socket = os.path.join(self.tmpdir,
+                                   "%s.sock" % self._testMethodName)
         self.sl = SocketListener(self.socket)
         return self.sl.startService()
 
     @deferred(timeout=30)
     def tearDown(self):
-        d = self.sl.stopService()
-        d.addCallback(lambda _x: shutil.rmtree(self.tmpdir))
-        return d
+        return self.sl.stopService()
 
 
     @deferred(timeout=10)
@@ -83,16 +88,14 @@ class SocketListenerTestCase(unittest.TestCase):
         # client
         reactor.connectUNIX(self.socket, SendingFactory(msg_sent))
 
-        d = defer.Deferred()
-        def get_output():
-            self.assertEqual(len(consumer.written), 1)
-            msg = consumer.written[0]
-            d.callback(msg)
+        def get_output(written):
+            self.assertEqual(len(written), 1)
+            return written[0]
         def check_msg(msg):
-            print(msg)
             self.assertEqual(msg, msg_sent_dict)
-        # On laisse un peu de temps pour traiter
-        reactor.callLater(0.5, get_output)
+        # On attend que le message soit traité
+        d = consumer.waitForWrites(1)
+        d.addCallback(get_output)
         d.addCallback(check_msg)
         return d
 
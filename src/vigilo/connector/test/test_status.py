@@ -57,7 +57,6 @@ class StatusPublisherTestCase(unittest.TestCase):
         sp._sendStats(stats, msg)
         def check(r_):
             output = client.channel.sent
-            print(output)
             self.assertEqual(len(output), 3)
             msg_out = [ json.loads(m["content"].body)
                         for m in output ]
@@ -84,7 +83,6 @@ class StatusPublisherTestCase(unittest.TestCase):
 
         def check(r):
             output = client.channel.sent
-            print(output)
             # 1 metric from the stub, 2 from StatusPublisher + the state
             self.assertEqual(len(output), 4)
             metrics = [json.loads(msg["content"].body)["datasource"]
@@ -126,7 +124,6 @@ class StatusPublisherTestCase(unittest.TestCase):
 
         def check(r):
             output = client.channel.sent
-            print(output)
             # 1 metric from the stub, 2 from StatusPublisher + the state
             self.assertEqual(len(output), 4)
             metrics = [json.loads(msg["content"].body)["datasource"]
@@ -165,7 +162,6 @@ class StatusPublisherTestCase(unittest.TestCase):
         def check(r):
             output = client.channel.sent
             for msg in output:
-                print(msg)
                 self.assertEqual(msg["exchange"], "foo")
         d.addCallback(check)
         return d